@@ -1,5 +1,6 @@
 import time
 import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from queue import Queue, Empty
 from dataclasses import dataclass
 from typing import Callable, Any, List
@@ -22,7 +23,7 @@ class BatchProcessor:
         self.metrics = BatchMetrics()
         self.running = False
         self.worker_thread = None
-        self.lock = threading.Lock()
+        # Metrics are written only by the processing thread, so no lock is needed
     
     def start(self):
         if self.running:
@@ -37,21 +38,19 @@ class BatchProcessor:
             self.worker_thread.join(timeout=2.0)
     
     def process(self, request):
-        result_queue = Queue(maxsize=1)
-        self.request_queue.put((request, result_queue))
-        with self.lock:
-            self.metrics.total_requests += 1
+        future = Future()
+        self.request_queue.put((request, future))
         
         # Wait for result
         try:
-            result = result_queue.get(timeout=10.0)
-            return result
-        except Empty:
+            return future.result(timeout=10.0)
+        except FutureTimeoutError:
+            # Distinct from the builtin TimeoutError before Python 3.11
             raise TimeoutError("Request processing timeout")
     
     def _processing_loop(self):
         batch = []
-        result_queues = []
+        futures = []
         last_batch_time = time.perf_counter()
         
         while self.running:
@@ -60,27 +59,37 @@ class BatchProcessor:
                 elapsed = time.perf_counter() - last_batch_time
                 timeout_remaining = max(0, self.timeout_ms - elapsed)
                 # Wait for next request
-                request, result_queue = self.request_queue.get(timeout=timeout_remaining)
+                request, future = self.request_queue.get(timeout=timeout_remaining)
                 batch.append(request)
-                result_queues.append(result_queue)
+                futures.append(future)
+                
+                # Drain whatever is already queued without blocking again
+                while len(batch) < self.max_batch_size:
+                    try:
+                        request, future = self.request_queue.get_nowait()
+                    except Empty:
+                        break
+                    batch.append(request)
+                    futures.append(future)
                 
                 # Trigger batch if full
                 if len(batch) >= self.max_batch_size:
-                    self._process_batch(batch, result_queues, timeout=False)
-                    batch, result_queues = [], []
+                    self._process_batch(batch, futures, timeout=False)
+                    batch, futures = [], []
                     last_batch_time = time.perf_counter()
                     
             except Empty:
                 # Trigger batch if timeout reached
                 if batch:
-                    self._process_batch(batch, result_queues, timeout=True)
-                    batch, result_queues = [], []
+                    self._process_batch(batch, futures, timeout=True)
+                    batch, futures = [], []
                 last_batch_time = time.perf_counter()
     
-    def _process_batch(self, batch, result_queues, timeout=False):
+    def _process_batch(self, batch, futures, timeout=False):
         """Process a batch of requests"""
         if not batch:
             return
+        self.metrics.total_requests += len(batch)
         
         try:
             # Process the batch
@@ -91,35 +100,34 @@ class BatchProcessor:
                 results = batch
             
             # Send results back
-            for result, result_queue in zip(results, result_queues):
-                result_queue.put(result)
-            with self.lock:
-                self.metrics.total_batches += 1
-                batch_size = len(batch)
-                
-                # Update average batch size
-                prev_total = self.metrics.avg_batch_size * (self.metrics.total_batches - 1)
-                self.metrics.avg_batch_size = (prev_total + batch_size) / self.metrics.total_batches
+            for result, future in zip(results, futures):
+                future.set_result(result)
+            self.metrics.total_batches += 1
+            batch_size = len(batch)
+            
+            # Update average batch size
+            prev_total = self.metrics.avg_batch_size * (self.metrics.total_batches - 1)
+            self.metrics.avg_batch_size = (prev_total + batch_size) / self.metrics.total_batches
+            
+            if timeout:
+                self.metrics.timeout_batches += 1
+            else:
+                self.metrics.full_batches += 1
                 
-                if timeout:
-                    self.metrics.timeout_batches += 1
-                else:
-                    self.metrics.full_batches += 1
-                    
         except Exception as e:
-            for result_queue in result_queues:
-                result_queue.put({"error": str(e)})
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
     
     def get_metrics(self):
         """Get current batch processing metrics"""
-        with self.lock:
-            return BatchMetrics(
-                total_requests=self.metrics.total_requests,
-                total_batches=self.metrics.total_batches,
-                avg_batch_size=self.metrics.avg_batch_size,
-                timeout_batches=self.metrics.timeout_batches,
-                full_batches=self.metrics.full_batches
-            )
+        return BatchMetrics(
+            total_requests=self.metrics.total_requests,
+            total_batches=self.metrics.total_batches,
+            avg_batch_size=self.metrics.avg_batch_size,
+            timeout_batches=self.metrics.timeout_batches,
+            full_batches=self.metrics.full_batches
+        )
 
 
 if __name__ == "__main__":
@@ -1,48 +1,138 @@
 import argparse
-import json
+import asyncio
 import time
+import aiohttp
 import numpy as np
+import orjson
 import urllib.request
 import urllib.error
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from collections import defaultdict
+from collections import Counter
+from tensor_codec import BINARY_CONTENT_TYPE, encode_request
+
+
+class LatencyHistogram:
+    """Log-linear latency histogram (HDR style) with constant memory.
+    
+    Values are integer microseconds. Each power-of-two range is split into
+    `sub_buckets` linear buckets, so any recorded value is reported within
+    ~0.1% of its true value. Values above `max_value_us` are clamped.
+    """
+    
+    def __init__(self, max_value_us=60_000_000, sub_bucket_bits=11):
+        self.sub_bucket_count = 1 << sub_bucket_bits
+        self.half_count = self.sub_bucket_count >> 1
+        self.sub_bucket_bits = sub_bucket_bits
+        self.max_value_us = max_value_us
+        self.counts = np.zeros(self._index(max_value_us) + 1, dtype=np.int64)
+        self.total_count = 0
+        self.total = 0
+        self.total_sq = 0
+        self.min_value = None
+        self.max_value = None
+    
+    def _index(self, value):
+        if value < self.sub_bucket_count:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits
+        return self.sub_bucket_count + (shift - 1) * self.half_count + ((value >> shift) - self.half_count)
+    
+    def _highest_equivalent(self, index):
+        if index < self.sub_bucket_count:
+            return index
+        shift, offset = divmod(index - self.sub_bucket_count, self.half_count)
+        shift += 1
+        return ((offset + self.half_count + 1) << shift) - 1
+    
+    def record_value(self, value):
+        value = min(max(int(value), 0), self.max_value_us)
+        self.counts[self._index(value)] += 1
+        self.total_count += 1
+        self.total += value
+        self.total_sq += value * value
+        if self.min_value is None or value < self.min_value:
+            self.min_value = value
+        if self.max_value is None or value > self.max_value:
+            self.max_value = value
+    
+    def add(self, other):
+        """Merge another histogram with the same layout into this one"""
+        self.counts += other.counts
+        self.total_count += other.total_count
+        self.total += other.total
+        self.total_sq += other.total_sq
+        for value in (other.min_value, other.max_value):
+            if value is not None:
+                self.min_value = value if self.min_value is None else min(self.min_value, value)
+                self.max_value = value if self.max_value is None else max(self.max_value, value)
+    
+    def get_values_at_percentiles(self, percentiles):
+        # One cumulative pass answers every requested percentile
+        cumulative = np.cumsum(self.counts)
+        targets = [max(1, int(np.ceil(p / 100.0 * self.total_count))) for p in percentiles]
+        indices = np.searchsorted(cumulative, targets, side='left')
+        return [min(self._highest_equivalent(int(i)), self.max_value) for i in indices]
+    
+    def get_value_at_percentile(self, percentile):
+        return self.get_values_at_percentiles([percentile])[0]
+    
+    def get_mean(self):
+        return self.total / self.total_count if self.total_count else 0.0
+    
+    def get_stddev(self):
+        if not self.total_count:
+            return 0.0
+        mean = self.get_mean()
+        return max(self.total_sq / self.total_count - mean * mean, 0.0) ** 0.5
 
 
 class LoadGenerator:
-    def __init__(self, target_url, num_requests, concurrent):
+    def __init__(self, target_url, num_requests, concurrent, payload_format='binary'):
         self.target_url = target_url
+        self.payload_format = payload_format
         self.num_requests = num_requests
         self.concurrent = concurrent
-        self.latencies = []
+        self.latency_hist = LatencyHistogram()
         self.errors = 0
-        self.node_distribution = defaultdict(int)
+        self.node_distribution = Counter()
+        # image input(a random matrix) is used for simulation; the content is
+        # noise, so every request shares one payload that is encoded only once
+        input_size = 224 * 224 * 3
+        self._input_data = np.random.rand(input_size).astype(np.float32)
+        if payload_format == 'binary':
+            self._content_type = BINARY_CONTENT_TYPE
+        else:
+            self._content_type = 'application/json'
+            self._input_json = orjson.dumps(self._input_data, option=orjson.OPT_SERIALIZE_NUMPY)
     
     def generate_request_data(self, req_id):
-        # image input(a random matrix) is used for simulation
-        input_size = 224 * 224 * 3
-        input_data = np.random.rand(input_size).tolist()
-        return {
+        header = {
             'request_id': f'req_{req_id}',
             'model_name': 'resnet50',
-            'input_data': input_data,
             'input_shape': [1, 224, 224, 3],
             'timestamp': int(time.time() * 1_000_000)
         }
+        if self.payload_format == 'binary':
+            # Raw float32 bytes after a small JSON header: 4 bytes per value
+            return encode_request(header, self._input_data)
+        # Only the small per-request fields are serialized; the pre-encoded
+        # input_data array is spliced into the JSON object
+        return orjson.dumps(header)[:-1] + b',"input_data":' + self._input_json + b'}'
     
-    def send_request(self, req_id):
-        request_data = self.generate_request_data(req_id)
-        start_time = time.time()
-        try:
-            req = urllib.request.Request(
-                f"{self.target_url}/infer",
-                data=json.dumps(request_data).encode('utf-8'),
-                headers={'Content-Type': 'application/json'}
-            )
-            
-            with urllib.request.urlopen(req, timeout=10) as response:
-                result = json.loads(response.read())
+    async def send_request(self, session, semaphore, req_id):
+        async with semaphore:
+            body = self.generate_request_data(req_id)
+            start_ns = time.perf_counter_ns()
+            async with session.post(f"{self.target_url}/infer", data=body,
+                                    headers={'Content-Type': self._content_type}) as response:
+                # HTTP errors are plain return values; no exception is built for them
+                if response.status != 200:
+                    return {
+                        'success': False,
+                        'error_code': response.status
+                    }
+                result = orjson.loads(await response.read())
                 
-            latency_ms = (time.time() - start_time) * 1000
+            latency_ms = (time.perf_counter_ns() - start_ns) / 1_000_000
             
             return {
                 'success': True,
@@ -50,67 +140,78 @@ class LoadGenerator:
                 'node_id': result.get('node_id', 'unknown'),
                 'inference_time': result.get('inference_time_us', 0) / 1000.0
             }
-            
-        except Exception as e:
-            return {
-                'success': False,
-                'error': str(e)
-            }
     
     def run(self):
         print(f"Starting load test: {self.num_requests} requests with {self.concurrent} concurrent")
         print(f"Target: {self.target_url}/infer")
         print("-" * 60)
-        start_time = time.time()
+        start_time = time.perf_counter()
+        asyncio.run(self._run_requests(start_time))
+        total_time = time.perf_counter() - start_time
+        print("\n" + "-" * 60)
+        
+        return self.analyze_results(total_time)
+    
+    async def _run_requests(self, start_time):
+        # One kept-alive connection pool shared by every request
+        connector = aiohttp.TCPConnector(limit=self.concurrent, keepalive_timeout=30)
+        timeout = aiohttp.ClientTimeout(total=10)
+        semaphore = asyncio.Semaphore(self.concurrent)
         completed = 0
+        node_ids = []  # folded into node_distribution in bulk
         
-        with ThreadPoolExecutor(max_workers=self.concurrent) as executor:
-            futures = [executor.submit(self.send_request, i) 
-                      for i in range(self.num_requests)]
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            tasks = [asyncio.create_task(self.send_request(session, semaphore, i))
+                     for i in range(self.num_requests)]
             
-            for future in as_completed(futures):
-                result = future.result()
+            for task in asyncio.as_completed(tasks):
+                # Any error raised by one request counts as a failure, never aborts the run
+                try:
+                    result = await task
+                except Exception:
+                    result = {'success': False}
                 completed += 1
                 
                 if result['success']:
-                    self.latencies.append(result['latency'])
-                    self.node_distribution[result['node_id']] += 1
+                    self.latency_hist.record_value(result['latency'] * 1000)
+                    node_ids.append(result['node_id'])
                 else:
                     self.errors += 1
                 if completed % 100 == 0:
-                    elapsed = time.time() - start_time
+                    self.node_distribution.update(node_ids)
+                    node_ids.clear()
+                    elapsed = time.perf_counter() - start_time
                     throughput = completed / elapsed
                     progress_pct = (completed * 100) // self.num_requests
                     print(f"Progress: {completed}/{self.num_requests} "
                           f"({progress_pct}%) - {throughput:.1f} req/s", 
                           end='\r')
         
-        total_time = time.time() - start_time
-        print("\n" + "-" * 60)
-        
-        return self.analyze_results(total_time)
+        self.node_distribution.update(node_ids)
     
     def analyze_results(self, total_time):
-        if not self.latencies:
+        hist = self.latency_hist
+        if not hist.total_count:
             print("ERROR: No successful requests!")
             return None
-        latencies = np.array(self.latencies)
+        # Histogram values are microseconds; results are reported in ms
+        p50, p95, p99 = (v / 1000.0 for v in hist.get_values_at_percentiles([50, 95, 99]))
         
         results = {
             'total_requests': self.num_requests,
-            'successful_requests': len(self.latencies),
+            'successful_requests': hist.total_count,
             'failed_requests': self.errors,
             'total_time': total_time,
-            'throughput': len(self.latencies) / total_time,
+            'throughput': hist.total_count / total_time,
             'latency': {
-                'mean': float(np.mean(latencies)),
-                'median': float(np.median(latencies)),
-                'p50': float(np.percentile(latencies, 50)),
-                'p95': float(np.percentile(latencies, 95)),
-                'p99': float(np.percentile(latencies, 99)),
-                'min': float(np.min(latencies)),
-                'max': float(np.max(latencies)),
-                'std': float(np.std(latencies))
+                'mean': hist.get_mean() / 1000.0,
+                'median': p50,
+                'p50': p50,
+                'p95': p95,
+                'p99': p99,
+                'min': hist.min_value / 1000.0,
+                'max': hist.max_value / 1000.0,
+                'std': hist.get_stddev() / 1000.0
             },
             'node_distribution': dict(self.node_distribution)
         }
@@ -146,8 +247,8 @@ class LoadGenerator:
             print(f"\nLoad Balance Variance: {variance:.2f}%")
         print("=" * 60)
         
-        with open('benchmark_results.json', 'w') as f:
-            json.dump(results, f, indent=2)
+        with open('benchmark_results.json', 'wb') as f:
+            f.write(orjson.dumps(results, option=orjson.OPT_INDENT_2))
         return results
 
 
@@ -159,19 +260,22 @@ def main():
                        help='Total number of requests')
     parser.add_argument('--concurrent', type=int, default=50, 
                        help='Concurrent requests')
+    parser.add_argument('--format', choices=['binary', 'json'], default='binary',
+                       help='Request body encoding for the input tensor')
     
     args = parser.parse_args()
     
     try:
         with urllib.request.urlopen(f"{args.target}/stats", timeout=2) as response:
-            stats = json.loads(response.read())
+            stats = orjson.loads(response.read())
             print(f"Gateway is accessible")
             print(f"Workers: {stats.get('num_workers', 0)}")
     except Exception as e:
         print(f"Cannot connect to gateway: {e}")
         print(f"Make sure gateway is running on {args.target}")
         return
-    generator = LoadGenerator(args.target, args.requests, args.concurrent)
+    generator = LoadGenerator(args.target, args.requests, args.concurrent,
+                              payload_format=args.format)
     generator.run()
 
 if __name__ == '__main__':
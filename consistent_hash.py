@@ -1,5 +1,24 @@
+import functools
 import hashlib
-from bisect import bisect_right
+import itertools
+from bisect import bisect_left, bisect_right
+from collections import Counter
+import numpy as np
+
+# Per-router memo size for get_node; every router clears it on membership change
+ROUTE_CACHE_SIZE = 8192
+
+
+def hash_key(key):
+    """64-bit blake2b digest of a str or bytes key, read straight into an int"""
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'big')
+
+
+def _memoize(get_node_impl):
+    return functools.lru_cache(maxsize=ROUTE_CACHE_SIZE)(get_node_impl)
+
 
 class ConsistentHash:
     def __init__(self, nodes=None, virtual_nodes=150):
@@ -7,22 +26,35 @@ class ConsistentHash:
         self.ring = {}  # hash -> node mapping
         self.sorted_keys = []  # sorted hash keys for binary search
         self.nodes = set()
+        # Repeated keys (retries, session affinity) skip the hash + bisect;
+        # cleared whenever ring membership changes
+        self._get_node_cached = _memoize(self._get_node_impl)
+        self._ring_arrays = None  # (sorted hashes, node index per hash, node list), built lazily
+        self._vnode_hashes = {}  # node -> virtual node ring positions, kept across churn
         if nodes:
             for node in nodes:
                 self.add_node(node)
     
-    def _hash(self, key):
-        return int(hashlib.md5(key.encode('utf-8')).hexdigest(), 16)
+    def _get_vnode_hashes(self, node):
+        hashes = self._vnode_hashes.get(node)
+        if hashes is None:
+            virtual_keys = [f"{node}#{i}".encode('utf-8') for i in range(self.virtual_nodes)]
+            hashes = [hash_key(virtual_key) for virtual_key in virtual_keys]
+            self._vnode_hashes[node] = hashes
+        return hashes
     
     def add_node(self, node):
         if node in self.nodes:
             return
         self.nodes.add(node)
-        for i in range(self.virtual_nodes):
-            virtual_key = f"{node}#{i}"
-            hash_value = self._hash(virtual_key)
-            self.ring[hash_value] = node
-        self.sorted_keys = sorted(self.ring.keys())
+        hashes = self._get_vnode_hashes(node)
+        new_hashes = sorted(h for h in set(hashes) if h not in self.ring)
+        self.ring.update(zip(hashes, itertools.repeat(node)))
+        # Two sorted runs: timsort merges them in a single linear pass
+        self.sorted_keys += new_hashes
+        self.sorted_keys.sort()
+        self._get_node_cached.cache_clear()
+        self._ring_arrays = None
     
     def remove_node(self, node):
         if node not in self.nodes:
@@ -30,54 +62,224 @@ class ConsistentHash:
         self.nodes.remove(node)
         
         # Remove all virtual nodes
-        for i in range(self.virtual_nodes):
-            virtual_key = f"{node}#{i}"
-            hash_value = self._hash(virtual_key)
+        for hash_value in self._get_vnode_hashes(node):
             if hash_value in self.ring:
                 del self.ring[hash_value]
+                del self.sorted_keys[bisect_left(self.sorted_keys, hash_value)]
         
-        self.sorted_keys = sorted(self.ring.keys())
+        self._get_node_cached.cache_clear()
+        self._ring_arrays = None
     
     def get_node(self, key):
+        return self._get_node_cached(key)
+    
+    def _get_node_impl(self, key):
         if not self.ring:
             return None
         
-        hash_value = self._hash(key)
+        hash_value = hash_key(key)
         index = bisect_right(self.sorted_keys, hash_value)
         if index == len(self.sorted_keys):
             index = 0
         
         return self.ring[self.sorted_keys[index]]
     
+    def get_next_node(self, key, exclude=()):
+        """Failover target: first node clockwise from the key that isn't excluded"""
+        if not self.ring:
+            return None
+        start = bisect_right(self.sorted_keys, hash_key(key))
+        num_keys = len(self.sorted_keys)
+        for step in range(num_keys):
+            node = self.ring[self.sorted_keys[(start + step) % num_keys]]
+            if node not in exclude:
+                return node
+        return None
+    
     def get_nodes(self):
         return list(self.nodes)
     
+    def _get_ring_arrays(self):
+        if self._ring_arrays is None:
+            node_list = sorted(self.nodes)
+            node_index = {node: i for i, node in enumerate(node_list)}
+            sorted_arr = np.array(self.sorted_keys, dtype=np.uint64)
+            node_arr = np.array([node_index[self.ring[k]] for k in self.sorted_keys], dtype=np.intp)
+            self._ring_arrays = (sorted_arr, node_arr, node_list)
+        return self._ring_arrays
+    
+    def _count_keys(self, keys):
+        """Per-node key counts, aligned with the node list of _get_ring_arrays"""
+        sorted_arr, node_arr, node_list = self._get_ring_arrays()
+        # One searchsorted call over all key hashes instead of a bisect per key,
+        # then a single counting pass (no sort, unlike np.unique)
+        hashes = np.fromiter((hash_key(key) for key in keys), dtype=np.uint64)
+        idx = np.searchsorted(sorted_arr, hashes, side='right') % len(sorted_arr)
+        return np.bincount(node_arr[idx], minlength=len(node_list))
+    
     def get_distribution(self, keys):
-        distribution = {node: 0 for node in self.nodes}
-        for key in keys:
-            node = self.get_node(key)
-            if node:
-                distribution[node] += 1
+        if not self.ring:
+            return {node: 0 for node in self.nodes}
         
-        return distribution
+        counts = self._count_keys(keys)
+        node_list = self._get_ring_arrays()[2]
+        return {node: int(count) for node, count in zip(node_list, counts)}
     
     def get_load_balance_variance(self, num_keys=10000):
-        if not self.nodes:
+        if not self.ring:
             return 0.0
         
         keys = [f"key_{i}" for i in range(num_keys)]
-        distribution = self.get_distribution(keys)
-        
-        counts = list(distribution.values())
-        if not counts:
-            return 0.0
+        counts = self._count_keys(keys)
         
-        mean = sum(counts) / len(counts)
-        variance = sum((x - mean) ** 2 for x in counts) / len(counts)
-        std_dev = variance ** 0.5
+        mean = counts.mean()
+        std_dev = counts.std()
         
         # Return as percentage of mean
-        return (std_dev / mean * 100) if mean > 0 else 0.0
+        return float(std_dev / mean * 100) if mean > 0 else 0.0
+
+
+def jump_consistent_hash(key, num_buckets):
+    """Lamping & Veach jump consistent hash: 64-bit key -> bucket in [0, num_buckets)"""
+    b, j = -1, 0
+    while j < num_buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return b
+
+
+class JumpHash:
+    """Ring-free router: O(1) memory, a handful of multiplies per lookup.
+    
+    Buckets are positional, so adding a node at the end only moves keys onto
+    it, but removing a node from the middle reshuffles the nodes after it.
+    """
+    
+    def __init__(self, nodes=None):
+        self.nodes = []
+        # Same memo as ConsistentHash: hot keys skip the blake2b + jump loop
+        self._get_node_cached = _memoize(self._get_node_impl)
+        if nodes:
+            for node in nodes:
+                self.add_node(node)
+    
+    def add_node(self, node):
+        if node not in self.nodes:
+            self.nodes.append(node)
+            self._get_node_cached.cache_clear()
+    
+    def remove_node(self, node):
+        if node in self.nodes:
+            self.nodes.remove(node)
+            self._get_node_cached.cache_clear()
+    
+    def get_node(self, key):
+        return self._get_node_cached(key)
+    
+    def _get_node_impl(self, key):
+        if not self.nodes:
+            return None
+        return self.nodes[jump_consistent_hash(hash_key(key), len(self.nodes))]
+    
+    def get_next_node(self, key, exclude=()):
+        """Failover target: jump hash over the nodes that aren't excluded.
+        
+        The key is re-hashed with the attempt number first. Jumping on the
+        original hash would send every key of a dead bucket to the same
+        survivor; the salted hash spreads them across all live nodes.
+        """
+        live = [node for node in self.nodes if node not in exclude]
+        if not live:
+            return None
+        salted = hash_key(key).to_bytes(8, 'big') + len(exclude).to_bytes(4, 'big')
+        return live[jump_consistent_hash(hash_key(salted), len(live))]
+    
+    def get_nodes(self):
+        return list(self.nodes)
+
+
+class MaglevHash:
+    """Maglev lookup-table router: one modulo and one list index per lookup.
+    
+    Every node walks its own permutation of the table slots and claims free
+    slots round-robin, so each ends up with an almost equal share, and a
+    membership change only moves a small fraction of slots.
+    """
+    
+    def __init__(self, nodes=None, table_size=65537):
+        # table_size must be prime so every skip in [1, M-1] yields a full permutation
+        self.table_size = table_size
+        self.nodes = []
+        self.lookup = []  # slot -> node
+        self._get_node_cached = _memoize(self._get_node_impl)
+        if nodes:
+            for node in nodes:
+                if node not in self.nodes:
+                    self.nodes.append(node)
+            self._populate()
+    
+    def _populate(self):
+        """Fills the lookup table with the standard Maglev round-robin"""
+        M = self.table_size
+        # Sorted so every gateway builds the same table for the same workers
+        nodes = sorted(self.nodes)
+        self._get_node_cached.cache_clear()
+        if not nodes:
+            self.lookup = []
+            return
+        offsets, skips = [], []
+        for node in nodes:
+            # Two independent 64-bit hashes from one 128-bit digest
+            digest = hashlib.blake2b(node.encode('utf-8'), digest_size=16).digest()
+            offsets.append(int.from_bytes(digest[:8], 'big') % M)
+            skips.append(int.from_bytes(digest[8:], 'big') % (M - 1) + 1)
+        table = [-1] * M
+        next_index = [0] * len(nodes)
+        filled = 0
+        while True:
+            for i in range(len(nodes)):
+                offset, skip, j = offsets[i], skips[i], next_index[i]
+                slot = (offset + j * skip) % M
+                while table[slot] >= 0:
+                    j += 1
+                    slot = (offset + j * skip) % M
+                table[slot] = i
+                next_index[i] = j + 1
+                filled += 1
+                if filled == M:
+                    self.lookup = [nodes[i] for i in table]
+                    return
+    
+    def add_node(self, node):
+        if node not in self.nodes:
+            self.nodes.append(node)
+            self._populate()
+    
+    def remove_node(self, node):
+        if node in self.nodes:
+            self.nodes.remove(node)
+            self._populate()
+    
+    def get_node(self, key):
+        return self._get_node_cached(key)
+    
+    def _get_node_impl(self, key):
+        if not self.lookup:
+            return None
+        return self.lookup[hash_key(key) % self.table_size]
+    
+    def get_next_node(self, key, exclude=()):
+        """Failover target: probe the slots after the key's until one isn't excluded"""
+        if not self.lookup or all(node in exclude for node in self.nodes):
+            return None
+        slot = hash_key(key) % self.table_size
+        while self.lookup[slot] in exclude:
+            slot = (slot + 1) % self.table_size
+        return self.lookup[slot]
+    
+    def get_nodes(self):
+        return list(self.nodes)
 
 
 if __name__ == "__main__":
@@ -97,4 +299,15 @@ if __name__ == "__main__":
     
     variance = ch.get_load_balance_variance(10000)
     print(f"\nLoad balance variance: {variance:.2f}%")
+    
+    for router in (JumpHash(nodes), MaglevHash(nodes)):
+        counts = Counter(router.get_node(key) for key in test_keys)
+        print(f"\n{type(router).__name__} distribution of {len(test_keys)} keys:")
+        for node, count in sorted(counts.items()):
+            print(f"  {node}: {count} ({count / len(test_keys) * 100:.2f}%)")
+        # Failover: where the keys of a dead node go instead
+        dead = nodes[0]
+        retries = Counter(router.get_next_node(key, {dead}) for key in test_keys
+                          if router.get_node(key) == dead)
+        print(f"  {dead} down, its keys fail over to: {dict(sorted(retries.items()))}")
     print("=" * 50)
\ No newline at end of file
@@ -1,26 +1,107 @@
 import argparse
-import json
+import asyncio
+import orjson
 import time
 import urllib.request
-import urllib.error
-from http.server import HTTPServer, BaseHTTPRequestHandler
-from consistent_hash import ConsistentHash
+import aiohttp
+from aiohttp import web
+from consistent_hash import ConsistentHash, JumpHash, MaglevHash
+from tensor_codec import BINARY_CONTENT_TYPE, MAX_BATCH_REQUESTS, decode_header, encode_request
+
+try:
+    import grpc_service
+except ImportError:
+    grpc_service = None
+
+JSON_HEADERS = {'Content-Type': 'application/json'}
+BINARY_HEADERS = {'Content-Type': BINARY_CONTENT_TYPE}
+# Worker failures that trigger failover to the next node; a worker that hangs
+# past the ClientTimeout surfaces as asyncio.TimeoutError
+RETRY_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError) + ((grpc_service.RpcError,) if grpc_service else ())
 
 class Gateway:
-    def __init__(self, workers):
+    def __init__(self, workers, routing='jump', transport='http'):
         self.workers = workers
-        self.hash_ring = ConsistentHash(workers, virtual_nodes=150)
+        self.routing = routing
+        if transport == 'grpc' and grpc_service is None:
+            print("grpcio not installed, forwarding over HTTP")
+            transport = 'http'
+        self.transport = transport
+        self.grpc_clients = {}  # worker URL -> client, created in start() when using gRPC
+        if routing == 'ring':
+            self.hash_ring = ConsistentHash(workers, virtual_nodes=150)
+        elif routing == 'maglev':
+            self.hash_ring = MaglevHash(workers)
+        else:
+            self.hash_ring = JumpHash(workers)
         self.request_count = 0
+        self.session = None  # created on the server's event loop in start()
         for worker in workers:
             try:
                 health_url = f"{worker}/health"
                 with urllib.request.urlopen(health_url, timeout=2) as response:
-                    data = json.loads(response.read())
+                    data = orjson.loads(response.read())
                     print(f"{worker} - {data.get('node_id', 'unknown')}")
             except Exception as e:
                 print(f"{worker} - Error: {e}")
     
-    def route_request(self, request_data):
+    async def start(self, app):
+        # One pooled, kept-alive client shared by every in-flight request
+        connector = aiohttp.TCPConnector(limit=0, limit_per_host=64, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=10)
+        )
+        if self.transport == 'grpc':
+            self.grpc_clients = {worker: grpc_service.GrpcWorkerClient(worker) for worker in self.workers}
+    
+    async def close(self, app):
+        if self.session:
+            await self.session.close()
+        for client in self.grpc_clients.values():
+            await client.close()
+    
+    def _uses_grpc(self, path):
+        # Only single inferences go over gRPC; /batch_infer stays on HTTP
+        return path == '/infer' and bool(self.grpc_clients)
+    
+    async def _forward(self, node, data, headers, path='/infer'):
+        if self._uses_grpc(path):
+            return await self.grpc_clients[node].infer(data)
+        async with self.session.post(f"{node}{path}", data=data, headers=headers) as response:
+            response.raise_for_status()
+            return orjson.loads(await response.read())
+    
+    async def _forward_with_failover(self, key, target_node, request_data, body=None, path='/infer'):
+        # Encode once; retries resend the same bytes
+        if self._uses_grpc(path):
+            # gRPC carries the binary frame; JSON requests are framed here
+            if body is None:
+                header = {k: v for k, v in request_data.items() if k != 'input_data'}
+                body = encode_request(header, request_data['input_data'])
+            data, headers = body, None
+        elif body is None:
+            data, headers = orjson.dumps(request_data), JSON_HEADERS
+        else:
+            # Binary tensor bodies are relayed byte-for-byte
+            data, headers = body, BINARY_HEADERS
+        try:
+            return await self._forward(target_node, data, headers, path)
+        except RETRY_ERRORS as e:
+            # Retry on the router's next choice for this key, skipping nodes that failed
+            failed = {target_node}
+            node = self.hash_ring.get_next_node(key, failed)
+            while node is not None:
+                try:
+                    return await self._forward(node, data, headers, path)
+                except Exception:
+                    failed.add(node)
+                    node = self.hash_ring.get_next_node(key, failed)
+            
+            raise Exception(f"All workers failed: {str(e)}")
+    
+    async def route_request(self, request_data, body=None):
+        """Route a request; `body` is the original binary frame when there is one"""
         self.request_count += 1
         # Getting target node using consistent hashing
         request_id = request_data.get('request_id', f'req_{self.request_count}')
@@ -30,36 +111,34 @@ class Gateway:
             raise Exception("No workers available")
         
         # Forward request to worker
-        url = f"{target_node}/infer"
-        req = urllib.request.Request(
-            url,
-            data=json.dumps(request_data).encode('utf-8'),
-            headers={'Content-Type': 'application/json'}
-        )
+        return await self._forward_with_failover(request_id, target_node, request_data, body)
+    
+    async def route_batch(self, requests):
+        """Group requests by target worker and send one /batch_infer POST per worker"""
+        groups = {}
+        group_keys = {}
+        for i, request_data in enumerate(requests):
+            self.request_count += 1
+            request_id = request_data.get('request_id', f'req_{self.request_count}')
+            target_node = self.hash_ring.get_node(request_id)
+            if not target_node:
+                raise Exception("No workers available")
+            groups.setdefault(target_node, []).append(i)
+            # A group fails over as a unit, following its first request's key
+            group_keys.setdefault(target_node, request_id)
         
-        try:
-            with urllib.request.urlopen(req, timeout=10) as response:
-                result = json.loads(response.read())
-                return result
-        except urllib.error.URLError as e:
-            # Retry with a different node
-            nodes = self.hash_ring.get_nodes()
-            for node in nodes:
-                if node != target_node:
-                    try:
-                        retry_url = f"{node}/infer"
-                        retry_req = urllib.request.Request(
-                            retry_url,
-                            data=json.dumps(request_data).encode('utf-8'),
-                            headers={'Content-Type': 'application/json'}
-                        )
-                        with urllib.request.urlopen(retry_req, timeout=10) as response:
-                            result = json.loads(response.read())
-                            return result
-                    except:
-                        continue
-            
-            raise Exception(f"All workers failed: {str(e)}")
+        results = await asyncio.gather(*(
+            self._forward_with_failover(group_keys[node], node,
+                                        {'requests': [requests[i] for i in indices]},
+                                        path='/batch_infer')
+            for node, indices in groups.items()
+        ))
+        # Put responses back in request order
+        responses = [None] * len(requests)
+        for indices, result in zip(groups.values(), results):
+            for i, response in zip(indices, result['responses']):
+                responses[i] = response
+        return responses
     
     def get_stats(self):
         """Get gateway statistics"""
@@ -69,56 +148,71 @@ class Gateway:
             'workers': self.workers
         }
 
-class GatewayRequestHandler(BaseHTTPRequestHandler):
-    gateway = None
+class GatewayRequestHandler:
+    def __init__(self, gateway):
+        self.gateway = gateway
     
-    def do_POST(self):
-        if self.path == '/infer':
-            try:
-                content_length = int(self.headers['Content-Length'])
-                body = self.rfile.read(content_length)
-                request_data = json.loads(body.decode('utf-8'))
-                response = self.gateway.route_request(request_data)
-                self.send_response(200)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps(response).encode('utf-8'))
-            except Exception as e:
-                self.send_error(500, f"Error: {str(e)}")
-        else:
-            self.send_error(404, "Not Found")
+    async def handle_infer(self, request):
+        try:
+            body = await request.read()
+            if request.content_type == BINARY_CONTENT_TYPE:
+                # Only the small header is parsed; the tensor is never decoded here
+                request_data, _ = decode_header(body)
+                response = await self.gateway.route_request(request_data, body=body)
+            else:
+                request_data = orjson.loads(body)
+                response = await self.gateway.route_request(request_data)
+            return web.Response(body=orjson.dumps(response), content_type='application/json')
+        except Exception as e:
+            return web.Response(status=500, text=f"Error: {str(e)}")
     
-    def do_GET(self):
-        if self.path == '/stats':
-            try:
-                stats = self.gateway.get_stats()
-                
-                self.send_response(200)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps(stats).encode('utf-8'))
-            except Exception as e:
-                self.send_error(500, f"Error: {str(e)}")
-        else:
-            self.send_error(404, "Not Found")
+    async def handle_batch_infer(self, request):
+        try:
+            request_data = orjson.loads(await request.read())
+            requests = request_data['requests']
+            if len(requests) > MAX_BATCH_REQUESTS:
+                return web.Response(status=413,
+                                    text=f"Batch of {len(requests)} exceeds {MAX_BATCH_REQUESTS} requests")
+            responses = await self.gateway.route_batch(requests)
+            return web.Response(body=orjson.dumps({'responses': responses}),
+                                content_type='application/json')
+        except Exception as e:
+            return web.Response(status=500, text=f"Error: {str(e)}")
     
-    def log_message(self, format, *args):
-        pass
+    async def handle_stats(self, request):
+        try:
+            return web.Response(body=orjson.dumps(self.gateway.get_stats()),
+                                content_type='application/json')
+        except Exception as e:
+            return web.Response(status=500, text=f"Error: {str(e)}")
+
+
+def create_app(gateway):
+    handler = GatewayRequestHandler(gateway)
+    # Inference payloads (~1.6MB of JSON) exceed aiohttp's 1MB default body limit
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_post('/infer', handler.handle_infer)
+    app.router.add_post('/batch_infer', handler.handle_batch_infer)
+    app.router.add_get('/stats', handler.handle_stats)
+    app.on_startup.append(gateway.start)
+    app.on_cleanup.append(gateway.close)
+    return app
 
 
 def main():
     parser = argparse.ArgumentParser(description='Gateway Server')
     parser.add_argument('--port', type=int, default=8000, help='Port to listen on')
-    parser.add_argument('--workers', nargs='+', 
+    parser.add_argument('--workers', nargs='+',
                        default=['http://localhost:8001', 'http://localhost:8002', 'http://localhost:8003'],
                        help='Worker addresses')
+    parser.add_argument('--routing', choices=['jump', 'ring', 'maglev'], default='jump',
+                       help='jump: jump consistent hash; ring: 150-vnode hash ring; maglev: Maglev lookup table')
+    parser.add_argument('--transport', choices=['http', 'grpc'], default='http',
+                       help='grpc forwards /infer over HTTP/2 to workers started with --grpc')
     
     args = parser.parse_args()
-    gateway = Gateway(args.workers)
-    # Set gateway instance in handler class
-    GatewayRequestHandler.gateway = gateway
-
-    server = HTTPServer(('localhost', args.port), GatewayRequestHandler)
+    gateway = Gateway(args.workers, routing=args.routing, transport=args.transport)
+    app = create_app(gateway)
     
     print()
     print("=" * 60)
@@ -128,16 +222,20 @@ def main():
     print(f"   Workers: {len(args.workers)}")
     for i, worker in enumerate(args.workers, 1):
         print(f"{i}. {worker}")
-    print(f"Routing: Consistent Hashing (150 virtual nodes)")
+    if args.routing == 'ring':
+        print(f"Routing: Consistent Hashing (150 virtual nodes)")
+    elif args.routing == 'maglev':
+        print(f"Routing: Maglev Hashing (65537-slot table)")
+    else:
+        print(f"Routing: Jump Consistent Hashing")
+    print(f"Transport: {gateway.transport}")
     print(f"Ready to route requests!")
     print("=" * 60)
     print()
     
-    try:
-        server.serve_forever()
-    except KeyboardInterrupt:
-        print("\nStopping gateway...")
-        server.shutdown()
+    # run_app handles Ctrl+C and runs the on_cleanup hooks before returning
+    web.run_app(app, host='localhost', port=args.port, print=None, access_log=None)
+    print("\nStopping gateway...")
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
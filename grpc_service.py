@@ -0,0 +1,85 @@
+import collections
+import urllib.parse
+from concurrent import futures
+import grpc
+import orjson
+from tensor_codec import decode_request
+
+# Requests travel as tensor_codec frames and responses as JSON bytes, so the
+# service needs no protobuf codegen; gRPC supplies HTTP/2 framing and streams
+SERVICE_NAME = 'inference.Inference'
+INFER_METHOD = f'/{SERVICE_NAME}/Infer'
+INFER_STREAM_METHOD = f'/{SERVICE_NAME}/InferStream'
+
+# A worker's gRPC port is its HTTP port plus this offset (8001 -> 9001)
+GRPC_PORT_OFFSET = 1000
+
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+CHANNEL_OPTIONS = [
+    ('grpc.keepalive_time_ms', 10000),
+    ('grpc.max_send_message_length', MAX_MESSAGE_BYTES),
+    ('grpc.max_receive_message_length', MAX_MESSAGE_BYTES),
+]
+
+RpcError = grpc.RpcError
+
+
+def grpc_target(worker_url):
+    """Map a worker's HTTP URL to its gRPC address"""
+    parsed = urllib.parse.urlsplit(worker_url)
+    return f"{parsed.hostname}:{parsed.port + GRPC_PORT_OFFSET}"
+
+
+def _dump_response(response):
+    return orjson.dumps(response, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def serve(worker, port, max_workers=32):
+    """Start a gRPC server exposing worker.handle_infer; returns the running server"""
+    stream_pool = futures.ThreadPoolExecutor(max_workers=max_workers)
+    
+    def infer(frame, context):
+        return worker.handle_infer(decode_request(frame))
+    
+    def infer_stream(frames, context):
+        # Submit frames as they arrive so a stream's in-flight requests can share
+        # a batch; responses are yielded in request order
+        pending = collections.deque()
+        for frame in frames:
+            pending.append(stream_pool.submit(worker.handle_infer, decode_request(frame)))
+            while pending and pending[0].done():
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    
+    handler = grpc.method_handlers_generic_handler(SERVICE_NAME, {
+        'Infer': grpc.unary_unary_rpc_method_handler(infer, response_serializer=_dump_response),
+        'InferStream': grpc.stream_stream_rpc_method_handler(infer_stream,
+                                                             response_serializer=_dump_response),
+    })
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=max_workers), options=CHANNEL_OPTIONS)
+    server.add_generic_rpc_handlers((handler,))
+    server.add_insecure_port(f'localhost:{port}')
+    server.start()
+    return server
+
+
+class GrpcWorkerClient:
+    """One long-lived HTTP/2 channel per worker; concurrent calls multiplex over it"""
+    
+    def __init__(self, worker_url):
+        # Must be created on the event loop that will use it
+        self.channel = grpc.aio.insecure_channel(grpc_target(worker_url), options=CHANNEL_OPTIONS)
+        self._infer = self.channel.unary_unary(INFER_METHOD, response_deserializer=orjson.loads)
+        self._infer_stream = self.channel.stream_stream(INFER_STREAM_METHOD,
+                                                        response_deserializer=orjson.loads)
+    
+    async def infer(self, frame, timeout=10.0):
+        return await self._infer(frame, timeout=timeout)
+    
+    def infer_stream(self, frames):
+        """Stream frames (an iterable or async iterable) and iterate the responses"""
+        return self._infer_stream(frames)
+    
+    async def close(self):
+        await self.channel.close()
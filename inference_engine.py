@@ -1,69 +1,278 @@
 import time
+import atexit
+import contextlib
 import numpy as np
+from multiprocessing import resource_tracker, shared_memory
 from typing import List, Tuple
 
+try:
+    import onnxruntime as ort
+    from onnx import TensorProto, helper, numpy_helper
+except ImportError:
+    ort = None
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+try:
+    from threadpoolctl import ThreadpoolController
+except ImportError:
+    ThreadpoolController = None
+
+NUM_LAYERS = 5
+# Below this many rows a single BLAS thread beats the cost of waking the pool
+SMALL_BATCH = 4
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _matmul_tanh_stack(x, w, out, n_layers):
+        """Row-parallel matmul+tanh stack; each tanh runs while its row is still in cache"""
+        for i in prange(x.shape[0]):
+            a = x[i].copy()
+            b = np.empty_like(a)
+            for _ in range(n_layers):
+                b[:] = 0
+                for k in range(w.shape[0]):
+                    a_k = a[k]
+                    for j in range(w.shape[1]):
+                        b[j] += a_k * w[k, j]
+                for j in range(b.shape[0]):
+                    b[j] = np.tanh(b[j])
+                a, b = b, a
+            out[i] = a
+
+
+def _build_layer_session(weights, precision):
+    """Builds an ONNX Runtime session running NUM_LAYERS x [MatMul, Tanh] at `precision`"""
+    nodes = []
+    x = 'x'
+    if precision == 'int8':
+        # Symmetric per-column int8 weights; activations are quantized per layer
+        # and each int32 product is rescaled back to fp32 before the tanh
+        elem_type = TensorProto.FLOAT
+        scale = np.abs(weights).max(axis=0) / 127
+        initializers = [
+            numpy_helper.from_array(np.round(weights / scale).astype(np.int8), 'W'),
+            numpy_helper.from_array(scale.astype(np.float32), 'W_scale'),
+        ]
+        for i in range(NUM_LAYERS):
+            nodes += [
+                helper.make_node('DynamicQuantizeLinear', [x], [f'q{i}', f'qs{i}', f'qz{i}']),
+                helper.make_node('MatMulInteger', [f'q{i}', 'W', f'qz{i}'], [f'mm{i}']),
+                helper.make_node('Cast', [f'mm{i}'], [f'f{i}'], to=TensorProto.FLOAT),
+                helper.make_node('Mul', [f'f{i}', f'qs{i}'], [f'ds{i}']),
+                helper.make_node('Mul', [f'ds{i}', 'W_scale'], [f'd{i}']),
+                helper.make_node('Tanh', [f'd{i}'], [f'h{i}']),
+            ]
+            x = f'h{i}'
+    else:
+        elem_type = TensorProto.FLOAT16
+        initializers = [numpy_helper.from_array(weights.astype(np.float16), 'W')]
+        for i in range(NUM_LAYERS):
+            nodes.append(helper.make_node('MatMul', [x, 'W'], [f'mm{i}']))
+            nodes.append(helper.make_node('Tanh', [f'mm{i}'], [f'h{i}']))
+            x = f'h{i}'
+    hidden = weights.shape[0]
+    graph = helper.make_graph(
+        nodes, 'tanh_stack',
+        [helper.make_tensor_value_info('x', elem_type, ['batch', hidden])],
+        [helper.make_tensor_value_info(x, elem_type, ['batch', hidden])],
+        initializer=initializers
+    )
+    # Pin an opset/IR version that older onnxruntime releases can still load
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 17)], ir_version=8)
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(model.SerializeToString(), options,
+                                providers=['CPUExecutionProvider'])
+
+
+def _shared_weights(shard_id, shape, make_weights):
+    """Maps one read-only copy of a shard's weights per host.
+    
+    The first process to start a shard creates the segment and fills it; later
+    ones wait for the ready byte and map the same pages. The creator unlinks it
+    on exit (or its resource tracker does if it is killed); processes already
+    attached keep their mapping.
+    """
+    name = f'die_weights_s{shard_id}_{shape[0]}x{shape[1]}'
+    header = 64  # ready flag, and keeps the matrix 64-byte aligned
+    size = header + int(np.prod(shape)) * np.dtype(np.float32).itemsize
+    try:
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        weights = np.ndarray(shape, dtype=np.float32, buffer=shm.buf, offset=header)
+        weights[:] = make_weights()
+        shm.buf[0] = 1
+        atexit.register(shm.unlink)
+    except FileExistsError:
+        shm = shared_memory.SharedMemory(name=name)
+        # Only the creator owns the segment; don't let our tracker unlink it
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        deadline = time.perf_counter() + 10.0
+        while shm.buf[0] != 1:
+            if time.perf_counter() > deadline:
+                raise TimeoutError(f"Shared weights {name} were never initialized")
+            time.sleep(0.01)
+        weights = np.ndarray(shape, dtype=np.float32, buffer=shm.buf, offset=header)
+    weights.flags.writeable = False
+    return shm, weights
+
 
 class InferenceEngine:
-    def __init__(self, model_name="resnet50", shard_id=0):
+    def __init__(self, model_name="resnet50", shard_id=0, max_batch_size=32, precision='fp32',
+                 use_numba=False, blas_threads=None, fast_mode=False, share_weights=False):
         self.model_name = model_name
         self.shard_id = shard_id
         self.num_classes = 1000
         # Increased weight size to create real CPU load
         self.hidden_size = 1024 
-        np.random.seed(42 + shard_id)
-        self.weights = np.random.randn(self.hidden_size, self.hidden_size).astype(np.float32)
+        shape = (self.hidden_size, self.hidden_size)
+        def make_weights():
+            np.random.seed(42 + shard_id)
+            return np.random.randn(*shape).astype(np.float32)
+        # Workers serving the same shard on one host can share a single copy
+        self._weights_shm = None
+        if share_weights:
+            self._weights_shm, self.weights = _shared_weights(shard_id, shape, make_weights)
+        else:
+            self.weights = make_weights()
+        # Ping-pong activation buffers reused by every call, so callers must serialize
+        # predict/batch_predict (WorkerNode holds _engine_lock around each call)
+        self.max_batch_size = max_batch_size
+        self.buf_a = np.empty((max_batch_size, self.hidden_size), dtype=np.float32)
+        self.buf_b = np.empty_like(self.buf_a)
+        # fp16/int8 run the layer stack in ONNX Runtime; without it we stay on numpy fp32
+        self._session = None
+        if precision != 'fp32' and ort is None:
+            print(f"onnxruntime/onnx not installed, {precision} falls back to fp32")
+            precision = 'fp32'
+        if precision != 'fp32':
+            self._session = _build_layer_session(self.weights, precision)
+        self._session_dtype = np.float16 if precision == 'fp16' else np.float32
+        self.precision = precision
+        # Optional fused numba kernel for the fp32 path (helps small batches most);
+        # fast_mode replaces the whole layer stack, so it takes precedence
+        if use_numba and njit is None:
+            print("numba not installed, using numpy matmul")
+        self.use_numba = use_numba and njit is not None and self._session is None and not fast_mode
+        if self.use_numba:
+            # Compile up front so the first request doesn't pay for it
+            _matmul_tanh_stack(self.buf_a[:1], self.weights, self.buf_b[:1], NUM_LAYERS)
+        # Cap BLAS threads per batch so co-located workers don't oversubscribe the cores
+        self.blas_threads = blas_threads
+        self._blas = None
+        if blas_threads and ThreadpoolController is not None:
+            self._blas = ThreadpoolController()
+        # fast_mode folds the stack into one matmul by W^5 and a single tanh, dropping the
+        # inner tanh calls. It is only valid while tanh stays near-linear; with these random
+        # weights |x @ W^5| is ~1e4-1e7, tanh saturates to exactly +/-1, and every input gets
+        # the same uniform output. Kept for experiments only, not exposed by the worker.
+        self.fast_mode = fast_mode and self._session is None
+        if self.fast_mode:
+            self.W_pow5 = np.linalg.matrix_power(self.weights.astype(np.float64), NUM_LAYERS).astype(np.float32)
+    
+    def _input_rows(self, batch_size):
+        """Returns buf_a[:batch_size] to copy inputs into (batch_size <= max_batch_size)"""
+        return self.buf_a[:batch_size]
+    
+    def _layers(self, batch_size):
+        """Runs the 5 matmul+tanh layers on buf_a[:batch_size].
+        
+        The numpy, numba and fast_mode paths work in place and return a view of
+        buf_a/buf_b; the ONNX Runtime path returns a new array.
+        """
+        if self._session is not None:
+            x = self.buf_a[:batch_size].astype(self._session_dtype)
+            return self._session.run(None, {'x': x})[0].astype(np.float32, copy=False)
+        if self.fast_mode:
+            out = self.buf_b[:batch_size]
+            with self._blas_limit(batch_size):
+                np.matmul(self.buf_a[:batch_size], self.W_pow5, out=out)
+            np.tanh(out, out=out)
+            return out
+        if self.use_numba:
+            out = self.buf_b[:batch_size]
+            _matmul_tanh_stack(self.buf_a[:batch_size], self.weights, out, NUM_LAYERS)
+            return out
+        a, b = self.buf_a[:batch_size], self.buf_b[:batch_size]
+        with self._blas_limit(batch_size):
+            for _ in range(NUM_LAYERS):
+                np.matmul(a, self.weights, out=b)
+                np.tanh(b, out=b) # Add non-linearity to keep CPU busy
+                a, b = b, a
+        return a
+    
+    def _blas_limit(self, batch_size):
+        if self._blas is None:
+            return contextlib.nullcontext()
+        threads = 1 if batch_size < SMALL_BATCH else self.blas_threads
+        return self._blas.limit(limits=threads, user_api='blas')
     
-    def predict(self, input_data: List[float], input_shape: List[int]) -> Tuple[List[float], int]:
+    def predict(self, input_data: List[float], input_shape: List[int]) -> Tuple[np.ndarray, int]:
         """Performs a real computation instead of sleeping."""
         start_time = time.perf_counter()
         
-        # 1. Transform input to match hidden size
-        x = np.array(input_data, dtype=np.float32)
+        # 1. Transform input to match hidden size (no copy if already float32)
+        x = np.asarray(input_data, dtype=np.float32)
         # Use only enough data to fill our matrix rows
-        x = x[:self.hidden_size] if x.size >= self.hidden_size else np.pad(x, (0, self.hidden_size - x.size))
-        x = x.reshape(1, self.hidden_size)
+        x = x[:self.hidden_size]
+        row = self._input_rows(1)[0]
+        row[:x.size] = x
+        row[x.size:] = 0
 
         # 2. Simulate deep layer processing with actual MatMul
         # This will naturally take time based on your CPU speed
-        for _ in range(5):
-            x = np.matmul(x, self.weights)
-            x = np.tanh(x) # Add non-linearity to keep CPU busy
+        x = self._layers(1)
 
         # 3. Project to classes
         output = np.abs(x[0, :self.num_classes])
-        output = (output / output.sum()).tolist()
+        output = output / output.sum()
         
         inference_time_us = int((time.perf_counter() - start_time) * 1_000_000)
         return output, inference_time_us
     
-    def batch_predict(self, inputs: List[List[float]], shapes: List[List[int]]) -> List[Tuple[List[float], int]]:
+    def batch_predict(self, inputs: List[List[float]], shapes: List[List[int]]) -> List[Tuple[np.ndarray, int]]:
         """Uses vectorized batch processing for efficiency."""
         if not inputs: return []
+        if len(inputs) > self.max_batch_size:
+            # Oversized batches run in buffer-sized chunks so the buffers never grow
+            step = self.max_batch_size
+            return [result for i in range(0, len(inputs), step)
+                    for result in self.batch_predict(inputs[i:i + step], shapes[i:i + step])]
         start_time = time.perf_counter()
         batch_size = len(inputs)
         
         # 1. Vectorized Batching: Convert list of lists to a single large matrix
         # This is where the 'distributed' efficiency actually comes from
-        batch_array = np.zeros((batch_size, self.hidden_size), dtype=np.float32)
-        for i, inp in enumerate(inputs):
-            arr = np.array(inp, dtype=np.float32)[:self.hidden_size]
-            batch_array[i, :len(arr)] = arr
+        hs = self.hidden_size
+        batch_array = self._input_rows(batch_size)
+        try:
+            # Truncate before converting so list inputs only parse the floats we use
+            raw = np.asarray([inp[:hs] for inp in inputs], dtype=np.float32)
+        except ValueError:
+            raw = None  # ragged inputs
+        if raw is not None and raw.ndim == 2:
+            batch_array[:, :raw.shape[1]] = raw
+            batch_array[:, raw.shape[1]:] = 0
+        else:
+            # Ragged inputs fall back to filling one row at a time
+            for i, inp in enumerate(inputs):
+                arr = np.asarray(inp, dtype=np.float32)[:hs]
+                batch_array[i, :len(arr)] = arr
+                batch_array[i, len(arr):] = 0
 
         # 2. Single large MatMul (much faster than looping over predict())
-        x = batch_array
-        for _ in range(5):
-            x = np.matmul(x, self.weights)
-            x = np.tanh(x)
+        x = self._layers(batch_size)
 
         total_time_us = int((time.perf_counter() - start_time) * 1_000_000)
         per_item_time = total_time_us // batch_size
         
-        results = []
-        for i in range(batch_size):
-            out = np.abs(x[i, :self.num_classes])
-            results.append(((out / out.sum()).tolist(), per_item_time))
-            
-        return results
+        # Normalize every row at once; each result is a row view of `probs`
+        probs = np.abs(x[:, :self.num_classes])
+        probs /= probs.sum(axis=1, keepdims=True)
+        return [(row, per_item_time) for row in probs]
     
     def get_model_info(self):
         """Get model information"""
@@ -71,6 +280,11 @@ class InferenceEngine:
             'model_name': self.model_name,
             'shard_id': self.shard_id,
             'num_classes': self.num_classes,
+            'precision': self.precision,
+            'use_numba': self.use_numba,
+            'blas_threads': self.blas_threads,
+            'fast_mode': self.fast_mode,
+            'shared_weights': self._weights_shm is not None,
             'weights_size_mb': self.weights.nbytes / (1024 * 1024)
         }
     
@@ -98,7 +312,7 @@ if __name__ == "__main__":
     print(f"  Input size: {len(input_data)}")
     print(f"  Output size: {len(output)}")
     print(f"  Inference time: {inference_time/1000:.2f} ms")
-    print(f"  Top-5 classes: {sorted(output, reverse=True)[:5]}")
+    print(f"  Top-5 classes: {np.sort(output)[::-1][:5].tolist()}")
     print()
     
     # Test batch inference
@@ -9,6 +9,11 @@ pkill -f worker_node.py 2>/dev/null
 pkill -f gateway.py 2>/dev/null
 sleep 1
 
+# Split the cores between the 3 workers so their BLAS pools don't oversubscribe
+BLAS_THREADS=$(( $(nproc) / 3 ))
+[ "$BLAS_THREADS" -lt 1 ] && BLAS_THREADS=1
+export OMP_NUM_THREADS=$BLAS_THREADS OPENBLAS_NUM_THREADS=$BLAS_THREADS MKL_NUM_THREADS=$BLAS_THREADS
+
 # Start worker nodes
 echo "Starting worker nodes..."
 python3 worker_node.py --port 8001 --node-id worker_1 > worker1.log 2>&1 &
@@ -0,0 +1,33 @@
+import struct
+import numpy as np
+import orjson
+
+BINARY_CONTENT_TYPE = 'application/octet-stream'
+# Largest /batch_infer request the gateway or a worker accepts
+MAX_BATCH_REQUESTS = 1024
+
+# Frame layout: [4-byte big-endian header length][JSON header][raw float32 tensor]
+_LENGTH = struct.Struct('>I')
+
+
+def encode_request(header, tensor):
+    """Pack request metadata and a float32 tensor into one binary body"""
+    header_bytes = orjson.dumps(header)
+    # Pad the header with JSON whitespace so the tensor starts 4-byte aligned
+    header_bytes += b' ' * (-(_LENGTH.size + len(header_bytes)) % 4)
+    tensor_bytes = np.ascontiguousarray(tensor, dtype=np.float32).tobytes()
+    return _LENGTH.pack(len(header_bytes)) + header_bytes + tensor_bytes
+
+
+def decode_header(body):
+    """Return (header dict, offset of the tensor bytes) without touching the tensor"""
+    (header_len,) = _LENGTH.unpack_from(body, 0)
+    offset = _LENGTH.size + header_len
+    return orjson.loads(body[_LENGTH.size:offset]), offset
+
+
+def decode_request(body):
+    """Decode a binary body into a request dict whose input_data is a zero-copy ndarray"""
+    header, offset = decode_header(body)
+    header['input_data'] = np.frombuffer(body, dtype=np.float32, offset=offset)
+    return header
@@ -1,17 +1,27 @@
 import argparse
-import json
+import orjson
+import threading
 import time
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from inference_engine import InferenceEngine
 from batch_processor import BatchProcessor
+from tensor_codec import BINARY_CONTENT_TYPE, MAX_BATCH_REQUESTS, decode_request
+
+try:
+    import grpc_service
+except ImportError:
+    grpc_service = None
 
 class WorkerNode:
     """Worker node with inference engine and batch processor"""
     
-    def __init__(self, node_id, port):
+    def __init__(self, node_id, port, precision='fp32', use_numba=False, blas_threads=None,
+                 share_weights=False):
         self.node_id = node_id
         self.port = port
-        self.engine = InferenceEngine(model_name="resnet50", shard_id=port % 3)
+        self.engine = InferenceEngine(model_name="resnet50", shard_id=port % 3,
+                                      precision=precision, use_numba=use_numba,
+                                      blas_threads=blas_threads, share_weights=share_weights)
         # Initialize batch processor
         self.batch_processor = BatchProcessor(
             max_batch_size=32,
@@ -19,13 +29,18 @@ class WorkerNode:
             process_fn=self._process_batch
         )
         self.batch_processor.start()
+        # The engine reuses its activation buffers, so batcher and /batch_infer take turns
+        self._engine_lock = threading.Lock()
+        # Request counters are updated from every handler thread
+        self._stats_lock = threading.Lock()
         self.total_requests = 0
         self.active_requests = 0
     
     def _process_batch(self, requests):
         inputs = [req['input_data'] for req in requests]
         shapes = [req['input_shape'] for req in requests]
-        batch_results = self.engine.batch_predict(inputs, shapes)
+        with self._engine_lock:
+            batch_results = self.engine.batch_predict(inputs, shapes)
         responses = []
         for i, (output, inference_time) in enumerate(batch_results):
             response = {
@@ -39,22 +54,40 @@ class WorkerNode:
         
         return responses
     
+    def _begin_requests(self, count):
+        with self._stats_lock:
+            self.total_requests += count
+            self.active_requests += count
+    
+    def _end_requests(self, count):
+        with self._stats_lock:
+            self.active_requests -= count
+    
     def handle_infer(self, request_data):
-        self.total_requests += 1
-        self.active_requests += 1
+        self._begin_requests(1)
         try:
             response = self.batch_processor.process(request_data)
             return response
         finally:
-            self.active_requests -= 1
+            self._end_requests(1)
+    
+    def handle_batch_infer(self, requests):
+        """Runs a batch the gateway already grouped, skipping the batching window"""
+        self._begin_requests(len(requests))
+        try:
+            return {'responses': self._process_batch(requests) if requests else []}
+        finally:
+            self._end_requests(len(requests))
     
     def handle_health(self):
         metrics = self.batch_processor.get_metrics()
+        with self._stats_lock:
+            active_requests, total_requests = self.active_requests, self.total_requests
         return {
             'healthy': True,
             'node_id': self.node_id,
-            'active_requests': self.active_requests,
-            'total_requests': self.total_requests,
+            'active_requests': active_requests,
+            'total_requests': total_requests,
             'batch_metrics': {
                 'total_batches': metrics.total_batches,
                 'avg_batch_size': metrics.avg_batch_size,
@@ -65,20 +98,47 @@ class WorkerNode:
 
 class WorkerRequestHandler(BaseHTTPRequestHandler):
     worker = None  
+    # Keep-alive: the gateway's pooled connections are reused across requests
+    protocol_version = 'HTTP/1.1'
+    
+    def _send_json(self, response):
+        # Output arrays are numpy; orjson writes them without a .tolist() pass
+        body = orjson.dumps(response, option=orjson.OPT_SERIALIZE_NUMPY)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
     def do_POST(self):
         if self.path == '/infer':
             try:
                 content_length = int(self.headers['Content-Length'])
                 body = self.rfile.read(content_length)
-                request_data = json.loads(body.decode('utf-8'))
+                # Compare the media type only; parameters like "; charset=" are ignored
+                content_type = self.headers.get('Content-Type', '').split(';')[0].strip()
+                if content_type == BINARY_CONTENT_TYPE:
+                    # Raw float32 tensor: viewed in place, no per-float parsing
+                    request_data = decode_request(body)
+                else:
+                    request_data = orjson.loads(body)
                 response = self.worker.handle_infer(request_data)
-                self.send_response(200)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps(response).encode('utf-8'))
+                self._send_json(response)
                 
             except Exception as e:
                 self.send_error(500, f"Error: {str(e)}")
+        elif self.path == '/batch_infer':
+            try:
+                content_length = int(self.headers['Content-Length'])
+                request_data = orjson.loads(self.rfile.read(content_length))
+                requests = request_data['requests']
+                if len(requests) > MAX_BATCH_REQUESTS:
+                    self.send_error(413, f"Batch of {len(requests)} exceeds {MAX_BATCH_REQUESTS} requests")
+                    return
+                response = self.worker.handle_batch_infer(requests)
+                self._send_json(response)
+            except Exception as e:
+                self.send_error(500, f"Error: {str(e)}")
         else:
             self.send_error(404, "Not Found")
     
@@ -86,10 +146,7 @@ class WorkerRequestHandler(BaseHTTPRequestHandler):
         if self.path == '/health':
             try:
                 response = self.worker.handle_health()
-                self.send_response(200)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps(response).encode('utf-8'))
+                self._send_json(response)
             except Exception as e:
                 self.send_error(500, f"Error: {str(e)}")
         else:
@@ -102,16 +159,40 @@ def main():
     parser = argparse.ArgumentParser(description='Worker Node Server')
     parser.add_argument('--port', type=int, default=8001, help='Port to listen on')
     parser.add_argument('--node-id', type=str, default=None, help='Node ID')
+    parser.add_argument('--precision', choices=['fp32', 'fp16', 'int8'], default='fp32',
+                       help='fp16/int8 run the layers in ONNX Runtime (needs onnxruntime and onnx); '
+                            'fp16 is slower on CPUs without native fp16 and correlates ~0.5 with fp32; '
+                            'int8 is ~6x faster but its outputs are essentially uncorrelated with fp32')
+    parser.add_argument('--numba', action='store_true',
+                       help='Run the fp32 layers in a fused numba kernel (needs numba)')
+    parser.add_argument('--blas-threads', type=int, default=None,
+                       help='Max BLAS threads per batch (needs threadpoolctl); run.sh sets the env defaults')
+    parser.add_argument('--share-weights', action='store_true',
+                       help='Map shard weights from shared memory shared by workers on this host')
+    parser.add_argument('--grpc', action='store_true',
+                       help='Also serve gRPC on port + 1000 (needs grpcio)')
     args = parser.parse_args()
     node_id = args.node_id or f"worker_{args.port}"
-    worker = WorkerNode(node_id, args.port)
+    worker = WorkerNode(node_id, args.port, precision=args.precision, use_numba=args.numba,
+                        blas_threads=args.blas_threads, share_weights=args.share_weights)
     WorkerRequestHandler.worker = worker
-    server = HTTPServer(('localhost', args.port), WorkerRequestHandler)
+    # One thread per connection so concurrent requests can meet in a batch
+    server = ThreadingHTTPServer(('localhost', args.port), WorkerRequestHandler)
+    grpc_server = None
+    if args.grpc:
+        if grpc_service is None:
+            print("grpcio not installed, serving HTTP only")
+        else:
+            grpc_port = args.port + grpc_service.GRPC_PORT_OFFSET
+            grpc_server = grpc_service.serve(worker, grpc_port)
     
     print(f"Worker Node: {node_id}")
     print(f"Port: {args.port}")
+    if grpc_server:
+        print(f"gRPC port: {grpc_port}")
     print(f"Model: {worker.engine.model_name}")
     print(f"Shard: {worker.engine.shard_id}")
+    print(f"Precision: {worker.engine.precision}")
     print(f"Batch size: {worker.batch_processor.max_batch_size}")
     print(f"Batch timeout: {worker.batch_processor.timeout_ms*1000:.0f}ms")
     print(f"Ready to accept requests!")
@@ -122,6 +203,8 @@ def main():
     except KeyboardInterrupt:
         print(f"\nStopping {node_id}...")
         worker.batch_processor.stop()
+        if grpc_server:
+            grpc_server.stop(grace=1)
         server.shutdown()
 
 if __name__ == '__main__':